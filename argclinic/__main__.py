@@ -1,59 +1,123 @@
-from argclinic.utils import Config, hash_text
-from argclinic.parser import ParseFunction
+import argparse
+import json
+import os
+import sys
+
+from argclinic.utils import Config, StreamOutput, hash_text
+from argclinic.manifest import Manifest
+from argclinic.parser import parse_functions
 from argclinic.cfunction import get_cfunction
-from argclinic.clanguage import (
-    Output, write_pydoc, write_methoddef, write_impl, write_impl_prototype,
-    write_function)
+from argclinic.clanguage import write_clinic, write_impl
+from argclinic.report import get_file_report
 
 
-def write(config, out, clinic_out, text):
-    parser_func = ParseFunction().parse(text)
+def write(config, out, clinic_out, text, parser_func):
     func = get_cfunction(config, parser_func)
 
-    output = Output()
-    write_pydoc(output, func)
-    output.write()
-    write_methoddef(output, func)
-    output.write()
-    write_impl_prototype(output, func)
-    output.write()
-    write_function(output, func)
-
-    for line in output.output:
-        print(line, file=clinic_out)
+    output = StreamOutput(clinic_out)
+    write_clinic(output, func)
 
-    output = Output()
+    output = StreamOutput(out)
     write_impl(output, func)
     in_hash = hash_text(text)
-    out_hash = hash_text('\n'.join(output.output))
+    out_hash = output.hexdigest()
     output.write(f'/*[clinic end generated code: output={out_hash} input={in_hash}]*/')
-    for line in output.output:
-        print(line, file=out)
+
+
+def get_blocks(lines):
+    # Return a list of (line index of the block end,
+    # line number of the first block line, text)
+    blocks = []
+    parse = False
+    to_parse = []
+    first_lineno = 0
+    for index, line in enumerate(lines):
+        if line == "/*[clinic input]\n":
+            parse = True
+            to_parse = []
+            first_lineno = index + 2
+        elif line == "[clinic start generated code]*/\n":
+            parse = False
+            blocks.append((index, first_lineno, '\n'.join(to_parse)))
+        elif parse:
+            to_parse.append(line.rstrip('\n'))
+    return blocks
+
+
+def parse_blocks(filename, blocks):
+    return parse_functions([text for _, _, text in blocks], filename,
+                           [first_lineno for _, first_lineno, _ in blocks])
+
+
+def generate(config, filename, text, filename2, filename3):
+    lines = text.splitlines(keepends=True)
+    blocks = get_blocks(lines)
+    funcs = parse_blocks(filename, blocks)
+    block_funcs = {index: (text, func)
+                   for (index, _, text), func in zip(blocks, funcs)}
+
+    with (open(filename2, "w") as out,
+          open(filename3, "w") as clinic_out):
+        for index, line in enumerate(lines):
+            out.write(line)
+            if index in block_funcs:
+                text, parser_func = block_funcs[index]
+                write(config, out, clinic_out, text, parser_func)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog="argclinic")
+    parser.add_argument('--report', action='store_true',
+                        help='write a JSON report of the generated code size '
+                             'to stdout, instead of generating code')
+    parser.add_argument('--manifest', metavar='FILENAME',
+                        help='skip input files unchanged since the '
+                             'previous run recorded in this manifest')
+    return parser.parse_args()
 
 
 def main():
+    args = parse_args()
     config = Config()
 
     filename = "file.c"
     filename2 = "file2.c"
     filename3 = "file2.clinic.c"
-    with (open(filename) as fp,
-          open(filename2, "w") as out,
-          open(filename3, "w") as clinic_out):
-        parse = False
-        to_parse = None
-        for line in fp:
-            out.write(line)
 
-            if line == "/*[clinic input]\n":
-                parse = True
-                to_parse = []
-            elif line == "[clinic start generated code]*/\n":
-                parse = False
+    if args.report:
+        with open(filename) as fp:
+            lines = fp.readlines()
+        blocks = get_blocks(lines)
+        parser_funcs = parse_blocks(filename, blocks)
+        funcs = [get_cfunction(config, parser_func)
+                 for parser_func in parser_funcs]
+        report = get_file_report(filename, funcs)
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        print()
+        return
+
+    manifest = None
+    if args.manifest:
+        manifest = Manifest(args.manifest, config)
+        manifest.load()
+        st = os.stat(filename)
+        if (manifest.check_stat(filename, st)
+                and manifest.check_outputs(filename)):
+            return
+
+    with open(filename) as fp:
+        text = fp.read()
+
+    if manifest is not None:
+        content_hash = hash_text(text)
+        if not (manifest.check_hash(filename, content_hash)
+                and manifest.check_outputs(filename)):
+            generate(config, filename, text, filename2, filename3)
+        manifest.update(filename, st, content_hash, [filename2, filename3])
+        manifest.save()
+    else:
+        generate(config, filename, text, filename2, filename3)
 
-                text = '\n'.join(to_parse)
-                write(config, out, clinic_out, text)
-            elif parse:
-                to_parse.append(line)
 
-main()
+if __name__ == "__main__":
+    main()
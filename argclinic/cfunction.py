@@ -1,14 +1,97 @@
-from argclinic.utils import Config, Output
-from argclinic.parser import ParameterKind, EMPTY
+import enum
+import re
+from typing import TYPE_CHECKING, Any
 
+from argclinic.utils import Config, Output
+from argclinic.parser import ParameterKind, ParserFunction, EMPTY
+if TYPE_CHECKING:
+    from argclinic.clanguage import Converter
+
+
+class Convention(enum.Enum):
+    NOARGS = "METH_NOARGS"
+    O = "METH_O"
+    VARARGS = "METH_VARARGS"
+    FASTCALL = "METH_FASTCALL"
+
+
+# 'module_state(ctype)' parameter type
+MODULE_STATE_PREFIX = "module_state("
+# 'choice(ctype, "literal"=CONSTANT, ...)' parameter type
+CHOICE_PREFIX = "choice("
+# no spaces around '=': the parser splits ' = ' as the default value
+_CHOICE_REGEX = re.compile(r'\s*"([^"]*)"=(\w+)\s*')
+
+
+def parse_choice_type(type: str) -> tuple[str, list[tuple[str, str]]]:
+    """
+    Parse a 'choice(ctype, "literal"=CONSTANT, ...)' parameter type.
+
+    Return (ctype, choices) where choices is a list of (literal, constant).
+    """
+    ctype, _, items = type[len(CHOICE_PREFIX):-1].partition(',')
+    ctype = ctype.strip()
+    if not ctype:
+        raise ValueError(f"missing C type in {type!r}")
+    choices = []
+    for item in items.split(','):
+        match = _CHOICE_REGEX.fullmatch(item)
+        if match is None:
+            raise ValueError(f"expect '\"literal\"=CONSTANT' choice, "
+                             f"got {item.strip()!r}")
+        choices.append((match.group(1), match.group(2)))
+    return (ctype, choices)
+
+
+class ReadOnly:
+    """
+    Base class of read-only objects: each attribute can only be set once,
+    in __init__().
+    """
+    __slots__ = ()
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        if hasattr(self, name):
+            raise AttributeError(f"{type(self).__name__}.{name} "
+                                 f"is read-only")
+        super().__setattr__(name, value)
+
+    def __delattr__(self, name: str) -> None:
+        raise AttributeError(f"{type(self).__name__}.{name} is read-only")
+
+
+class CParameter(ReadOnly):
+    __slots__ = ('name', 'type', 'ctype', 'kind', 'default')
 
-class CParameter:
     def __init__(self, name: str, *, type: str,
                  kind: ParameterKind, default: str = EMPTY) -> None:
         self.name = name
         self.type = type
-        if type == "module":
+        if kind == ParameterKind.VAR_POSITIONAL:
+            # '*args: object' passes the arguments array without a tuple,
+            # '*args: tuple' creates a tuple
+            if type == "object":
+                self.ctype = "PyObject *const*"
+            elif type == "tuple":
+                self.ctype = "PyObject*"
+            else:
+                raise ValueError(f"*{name} type must be object or tuple, "
+                                 f"got {type!r}")
+        elif type == "module":
             self.ctype = "PyObject*"
+        elif type.startswith(MODULE_STATE_PREFIX):
+            if not type.endswith(")"):
+                raise ValueError(f"missing ')' in {type!r}")
+            ctype = type[len(MODULE_STATE_PREFIX):-1].strip()
+            if not ctype:
+                raise ValueError(f"missing C type in {type!r}")
+            self.ctype = ctype + "*"
+        elif type.startswith(CHOICE_PREFIX):
+            if not type.endswith(")"):
+                raise ValueError(f"missing ')' in {type!r}")
+            self.ctype, _ = parse_choice_type(type)
+        elif self.is_array():
+            self.ctype = type[:-2].strip() + "*"
         else:
             self.ctype = type
         self.kind = kind
@@ -17,10 +100,27 @@ class CParameter:
     def can_use_meth_o(self) -> bool:
         return (self.kind == ParameterKind.POSITIONAL_ONLY)
 
-    def is_module(self):
+    def is_module(self) -> bool:
         return (self is MODULE_PARAM)
 
-    def is_optional(self):
+    def is_defining_class(self) -> bool:
+        return (self.type == "defining_class")
+
+    def is_module_state(self) -> bool:
+        return (self.type.startswith(MODULE_STATE_PREFIX)
+                and self.type.endswith(")"))
+
+    def is_array(self) -> bool:
+        # C array: the impl gets a pointer and a '{name}_length' length
+        return self.type.endswith("[]")
+
+    def is_varargs(self) -> bool:
+        return (self.kind == ParameterKind.VAR_POSITIONAL)
+
+    def is_choice(self) -> bool:
+        return self.type.startswith(CHOICE_PREFIX)
+
+    def is_optional(self) -> bool:
         return (self.default is not EMPTY)
 
 
@@ -28,73 +128,170 @@ MODULE_PARAM = CParameter("module", type="module",
                           kind=ParameterKind.POSITIONAL_ONLY)
 
 
-class CFunction:
+class ParseArg(ReadOnly):
+    # 'converter' is the converter class, filled lazily by
+    # clanguage.get_converter()
+    __slots__ = ('index', 'param', 'converter')
+    converter: 'type[Converter]'
+
+    def __init__(self, index: int, param: CParameter) -> None:
+        self.index = index
+        self.param = param
+
+
+class ParsePlan(ReadOnly):
+    """
+    Facts about the arguments of a CFunction, computed once and consumed by
+    every write_xxx() function.
+    """
+    __slots__ = ('convention', 'args', 'min_nargs', 'max_nargs',
+                 'module_state', 'varargs', 'param_args')
+
+    def __init__(self, params: tuple[CParameter, ...]) -> None:
+        args: list[ParseArg] = []
+        min_nargs = 0
+        module_state: CParameter | None = None
+        varargs: CParameter | None = None
+        # ParseArg of each parameter, None if it's not parsed
+        param_args: list[ParseArg | None] = []
+        for param in params:
+            param_args.append(None)
+            if param.is_defining_class():
+                # METH_METHOD requires a class: PyCMethod_New() rejects
+                # it for module functions
+                raise ValueError(f"{param.name}: defining_class is not "
+                                 f"supported by module functions")
+            if param.is_module_state():
+                if module_state is not None:
+                    raise ValueError("only one module_state parameter is allowed")
+                module_state = param
+                continue
+            if param.is_module():
+                continue
+            if param.is_varargs():
+                if varargs is not None:
+                    raise ValueError("only one *args parameter is allowed")
+                if min_nargs != len(args):
+                    # optional arguments are not parsed yet
+                    raise ValueError(f"optional parameter before *{param.name} "
+                                     f"is not supported")
+                varargs = param
+                # the varargs start after the positional arguments
+                param_args[-1] = ParseArg(len(args), param)
+                continue
+            if varargs is not None:
+                raise ValueError(f"parameter after *{varargs.name} "
+                                 f"is not supported: {param.name!r}")
+            if not param.is_optional():
+                min_nargs += 1
+            plan_arg = ParseArg(len(args), param)
+            param_args[-1] = plan_arg
+            args.append(plan_arg)
+        self.args = tuple(args)
+        self.min_nargs = min_nargs
+        self.max_nargs = len(args)
+        self.module_state = module_state
+        self.varargs = varargs
+        self.param_args = tuple(param_args)
+
+        if varargs is not None:
+            self.convention = Convention.FASTCALL
+        elif not args:
+            self.convention = Convention.NOARGS
+        elif len(args) == 1 and args[0].param.can_use_meth_o():
+            self.convention = Convention.O
+        else:
+            self.convention = Convention.VARARGS
+
+
+class CFunction(ReadOnly):
+    __slots__ = ('name', 'func_name', 'impl_name', 'doc_varname', 'params',
+                 'doc', 'plan', 'calling_convention')
+
     def __init__(self, config: Config, name: str, params: list[CParameter],
                  *, doc: str = "") -> None:
         self.name = name
         self.func_name = name.replace(".", "_")
         self.impl_name = f"{self.func_name}_impl"
         self.doc_varname = f"{self.func_name}__doc__"
-        self.params = params
+        self.params = tuple(params)
         self.doc = doc
-        self.calling_convention = CallingConvention._get_calling_convention(self)
+        self.plan = ParsePlan(self.params)
+        self.calling_convention = CallingConvention(self.plan.convention, self)
 
-    def get_min_max_args(self):
-        min_nargs = 0
-        max_nargs = 0
-        for param in self.params:
-            if param.is_module():
-                continue
-            if not param.is_optional():
-                min_nargs += 1
-            max_nargs += 1
-        return (min_nargs, max_nargs)
+    def get_min_max_args(self) -> tuple[int, int]:
+        return (self.plan.min_nargs, self.plan.max_nargs)
 
 
-class CallingConvention:
-    def __init__(self, name: str, func: CFunction) -> None:
-        self.name = name
+class CallingConvention(ReadOnly):
+    __slots__ = ('kind', 'name', 'func')
+
+    def __init__(self, kind: Convention, func: CFunction) -> None:
+        self.kind = kind
+        self.name = kind.value
         self.func = func
 
     def __repr__(self) -> str:
         return f"<CallingConvention {self.name}>"
 
-    def get_arg_value(self, index) -> str:
-        if self.name == "METH_NOARGS":
+    def get_arg_value(self, index: int) -> str:
+        kind = self.kind
+        if kind is Convention.NOARGS:
             raise Exception("METH_NOARGS has no arguments")
-        elif self.name == "METH_O":
+        elif kind is Convention.O:
             if index > 0:
                 raise Exception("METH_O has a single argument")
             return 'arg'
+        elif kind is Convention.FASTCALL:
+            return f'args[{index}]'
         else:  # METH_VARARGS
             return f'PyTuple_GET_ITEM(args, {index})'
 
+    def get_varargs(self) -> tuple[str, str]:
+        # (array, length) of the arguments after the positional arguments
+        if self.kind is not Convention.FASTCALL:
+            raise ValueError(f"{self.name} doesn't support *args")
+        start = self.func.plan.max_nargs
+        if not start:
+            return ('args', 'nargs')
+        return (f'args + {start}', f'nargs - {start}')
+
     def write_prototype(self, output: Output) -> None:
         name = self.func.func_name
         first_arg = self.func.params[0].name
 
         output.write('static PyObject *')
-        if self.name == "METH_NOARGS":
+        kind = self.kind
+        if kind is Convention.NOARGS:
             line = f'{name}(PyObject *{first_arg}, PyObject *Py_UNUSED(ignored))'
-        elif self.name == "METH_O":
+        elif kind is Convention.O:
             line = f'{name}(PyObject *{first_arg}, PyObject *arg)'
+        elif kind is Convention.FASTCALL:
+            line = (f'{name}(PyObject *{first_arg}, '
+                    f'PyObject *const *args, Py_ssize_t nargs)')
         else:  # METH_VARARGS
             line = f'{name}(PyObject *{first_arg}, PyObject *args)'
         output.write(line)
 
     def get_nargs(self) -> str:
-        if self.name == "METH_VARARGS":
+        if self.kind in (Convention.VARARGS, Convention.FASTCALL):
             return 'nargs'
         else:
             raise ValueError("not implemented")
 
     def write_check_nargs(self, output: Output) -> None:
-        if self.name != "METH_VARARGS":
+        if self.kind not in (Convention.VARARGS, Convention.FASTCALL):
             # nothing to check
             return
 
         name = self.func.name
-        min_args, max_args = self.func.get_min_max_args()
+        plan = self.func.plan
+        min_args = plan.min_nargs
+        max_args = plan.max_nargs
+
+        if plan.varargs is not None and not min_args:
+            # nothing to check
+            return
 
         output.write(f'if (nargs < {min_args}) {{')
         output.write(f'PyErr_Format(PyExc_TypeError, '
@@ -104,6 +301,10 @@ class CallingConvention:
         output.write('}')
         output.write()
 
+        if plan.varargs is not None:
+            # no maximum
+            return
+
         output.write(f'if (nargs > {max_args}) {{')
         output.write(f'PyErr_Format(PyExc_TypeError, '
                      f'"{name} expected at most {max_args} arguments, '
@@ -113,30 +314,35 @@ class CallingConvention:
         output.write()
 
     def write_nargs(self, output: Output) -> None:
-        if self.name == "METH_VARARGS":
+        if self.kind is Convention.VARARGS:
             output.write('const Py_ssize_t nargs = PyTuple_GET_SIZE(args);')
 
-    @staticmethod
-    def _get_calling_convention(func: CFunction) -> 'CallingConvention':
-        params = list(func.params)
-        if params and params[0].is_module():
-            del params[0]
+    def write_module_state(self, output: Output) -> None:
+        state = self.func.plan.module_state
+        if state is None:
+            return
 
-        if not params:
-            return CallingConvention("METH_NOARGS", func)
-        elif len(params) == 1 and params[0].can_use_meth_o():
-            return CallingConvention("METH_O", func)
-        else:
-            return CallingConvention("METH_VARARGS", func)
+        # Get the state once and pass it to the impl function
+        ctype = state.ctype[:-1].strip()
+        module = self.func.params[0].name
+        output.write(f'{ctype} *{state.name} = ({ctype} *)PyModule_GetState({module});')
+        output.write(f'if ({state.name} == NULL) {{')
+        # PyModule_GetState() doesn't set an exception if the module
+        # has no state
+        output.write('if (!PyErr_Occurred()) {', 1)
+        output.write(f'PyErr_SetString(PyExc_SystemError, '
+                     f'"{self.func.name}: module has no state");', 2)
+        output.write('}', 1)
+        output.write('goto exit;', 1)
+        output.write('}')
 
 
-def get_cfunction(config, func):
-    params = [
+def get_cfunction(config: Config, func: ParserFunction) -> CFunction:
+    params = [MODULE_PARAM]
+    params.extend(
         CParameter(param.name, type=param.type, kind=param.kind,
-                          default=param.default)
-        for param in func.params]
-
-    params.insert(0, MODULE_PARAM )
+                   default=param.default)
+        for param in func.params)
 
     return CFunction(config, func.name, params, doc=func.doc)
 
@@ -146,6 +352,8 @@ def get_text_signature(func: CFunction) -> str:
     slash = False
     comma = False
     for param in func.params:
+        if param.is_module_state():
+            continue
         if comma:
             sig.append(', ')
         comma = True
@@ -157,6 +365,8 @@ def get_text_signature(func: CFunction) -> str:
         name = param.name
         if param.is_module():
             name = f'${name}'
+        elif param.is_varargs():
+            name = f'*{name}'
         if param.default is not EMPTY:
             sig.append(f'{name}={param.default}')
         else:
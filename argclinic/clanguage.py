@@ -1,16 +1,20 @@
 from argclinic.utils import Output
-from argclinic.cfunction import CFunction, CParameter, get_text_signature
+from argclinic.cfunction import (
+    CFunction, CParameter, Convention, ParseArg, get_text_signature,
+    parse_choice_type)
 
 
 def escape_string(text: str) -> str:
+    text = text.replace('\\', '\\\\')
     text = text.replace('"', '\\"')
+    text = text.replace('\n', '\\n')
     return f'"{text}"'
 
 
 def write_pydoc(output: Output, func: CFunction) -> None:
     doc = func.doc
 
-    newline = "\\n"
+    newline = "\n"
     output.write(f"PyDoc_STRVAR({func.doc_varname},")
     output.write(escape_string(get_text_signature(func) + newline))
     output.write(escape_string("--" + newline))
@@ -32,7 +36,11 @@ def write_methoddef(output: Output, func: CFunction) -> None:
     output.write(line)
 
     calling_convention = func.calling_convention
-    line = f'{{"{name}", (PyCFunction){name}, {calling_convention.name}, {func.doc_varname}}},'
+    if calling_convention.kind is Convention.FASTCALL:
+        cast = '(PyCFunction)(void(*)(void))'
+    else:
+        cast = '(PyCFunction)'
+    line = f'{{"{name}", {cast}{name}, {calling_convention.name}, {func.doc_varname}}},'
     output.write(line, 1)
 
 
@@ -46,9 +54,23 @@ class Converter:
     def _write(self, line: str = "", level: int = 0) -> None:
         self.output.write(line, level)
 
+    def declare(self) -> None:
+        # Variables which must be declared before the first 'goto exit'
+        pass
+
     def parse_param(self) -> None:
         raise NotImplementedError
 
+    def cleanup(self) -> None:
+        # Code written after the 'exit:' label
+        pass
+
+    def get_impl_args(self) -> list[tuple[str, str, str]]:
+        # Parameters of the impl function: list of (ctype, name, value)
+        # where value is the expression passed by the wrapper
+        param = self.param
+        return [(param.ctype, param.name, param.name)]
+
 
 class BoolConverter(Converter):
     def parse_param(self):
@@ -74,31 +96,296 @@ class IntConverter(Converter):
         self._write()
 
 
+class ArrayConverter(Converter):
+    """
+    Convert a list or a tuple to a C array.
+
+    Use a stack buffer for up to STACK_SIZE items, or a single heap
+    allocation for larger sequences.
+    """
+    STACK_SIZE = 16
+    item_type = ''
+
+    def write_exact_item(self, item: str, dest: str) -> None:
+        raise NotImplementedError
+
+    def write_item(self, item: str, dest: str) -> None:
+        raise NotImplementedError
+
+    def declare(self):
+        name = self.param.name
+        self._write(f'{self.item_type} {name}_stack[{self.STACK_SIZE}];')
+        self._write(f'{self.item_type} *{name} = {name}_stack;')
+        self._write(f'Py_ssize_t {name}_length = 0;')
+
+    def parse_param(self):
+        name = self.param.name
+        arg = f'{name}_seq'
+        self._write(f'PyObject *{arg} = {self.arg};')
+        self._write(f'if (!PyList_Check({arg}) && !PyTuple_Check({arg})) {{')
+        self._write(f'PyErr_Format(PyExc_TypeError, '
+                    f'"{name} must be a list or a tuple, not %.200s", '
+                    f'Py_TYPE({arg})->tp_name);', 1)
+        self._write('goto exit;', 1)
+        self._write('}')
+        self._write(f'{name}_length = PySequence_Fast_GET_SIZE({arg});')
+        self._write(f'if ({name}_length > {self.STACK_SIZE}) {{')
+        self._write(f'{name} = PyMem_New({self.item_type}, {name}_length);', 1)
+        self._write(f'if ({name} == NULL) {{', 1)
+        self._write('PyErr_NoMemory();', 2)
+        self._write('goto exit;', 2)
+        self._write('}', 1)
+        self._write('}')
+        self._write(f'for (Py_ssize_t i = 0; i < {name}_length; i++) {{')
+        with self.output.indent():
+            # a list can be modified by a conversion method
+            self._write(f'if (i >= PySequence_Fast_GET_SIZE({arg})) {{')
+            self._write(f'PyErr_SetString(PyExc_RuntimeError, '
+                        f'"{name} changed size during conversion");', 1)
+            self._write('goto exit;', 1)
+            self._write('}')
+            self._write(f'PyObject *item = PySequence_Fast_GET_ITEM({arg}, i);')
+            self.write_exact_item('item', f'{name}[i]')
+            self._write('else {')
+            with self.output.indent():
+                self._write('Py_INCREF(item);')
+                self.write_item('item', f'{name}[i]')
+                self._write('Py_DECREF(item);')
+                self._write(f'if ({name}[i] == -1 && PyErr_Occurred()) {{')
+                self._write('goto exit;', 1)
+                self._write('}')
+            self._write('}')
+        self._write('}')
+        self._write()
+
+    def cleanup(self):
+        name = self.param.name
+        self._write(f'if ({name} != {name}_stack) {{')
+        self._write(f'PyMem_Free({name});', 1)
+        self._write('}')
+
+    def get_impl_args(self):
+        name = self.param.name
+        return [(self.param.ctype, name, name),
+                ('Py_ssize_t', f'{name}_length', f'{name}_length')]
+
+
+class DoubleArrayConverter(ArrayConverter):
+    item_type = 'double'
+
+    def write_exact_item(self, item, dest):
+        self._write(f'if (PyFloat_CheckExact({item})) {{')
+        self._write(f'{dest} = PyFloat_AS_DOUBLE({item});', 1)
+        self._write('}')
+
+    def write_item(self, item, dest):
+        self._write(f'{dest} = PyFloat_AsDouble({item});')
+
+
+class SsizeArrayConverter(ArrayConverter):
+    item_type = 'Py_ssize_t'
+
+    def write_exact_item(self, item, dest):
+        # PyLong_AsSsize_t() doesn't call __index__()
+        self._write(f'if (PyLong_CheckExact({item})) {{')
+        self._write(f'{dest} = PyLong_AsSsize_t({item});', 1)
+        self._write(f'if ({dest} == -1 && PyErr_Occurred()) {{', 1)
+        self._write('goto exit;', 2)
+        self._write('}', 1)
+        self._write('}')
+
+    def write_item(self, item, dest):
+        self._write(f'{dest} = PyNumber_AsSsize_t({item}, PyExc_OverflowError);')
+
+
+class ChoiceConverter(Converter):
+    """
+    Convert a str from a fixed set of literals to a C enum constant.
+
+    Literals are interned once. Compare pointers first, and then compare
+    the length before comparing the content.
+    """
+    def parse_param(self):
+        name = self.param.name
+        ctype, choices = parse_choice_type(self.param.type)
+        strs = f'{name}_choices'
+        arg = f'{name}_str'
+
+        nchoice = len(choices)
+        literals = ', '.join(escape_string(literal) for literal, _ in choices)
+        self._write(f'static PyObject *{strs}[{nchoice}];')
+        self._write(f'if ({strs}[0] == NULL) {{')
+        with self.output.indent():
+            # only publish the strings once they are all interned
+            self._write(f'static const char *const {name}_literals[{nchoice}] = {{{literals}}};')
+            self._write(f'PyObject *{name}_interned[{nchoice}];')
+            self._write(f'for (Py_ssize_t i = 0; i < {nchoice}; i++) {{')
+            with self.output.indent():
+                self._write(f'{name}_interned[i] = PyUnicode_InternFromString({name}_literals[i]);')
+                self._write(f'if ({name}_interned[i] == NULL) {{')
+                self._write('while (--i >= 0) {', 1)
+                self._write(f'Py_DECREF({name}_interned[i]);', 2)
+                self._write('}', 1)
+                self._write('goto exit;', 1)
+                self._write('}')
+            self._write('}')
+            self._write(f'for (Py_ssize_t i = 0; i < {nchoice}; i++) {{')
+            self._write(f'{strs}[i] = {name}_interned[i];', 1)
+            self._write('}')
+        self._write('}')
+
+        self._write(f'PyObject *{arg} = {self.arg};')
+        self._write(f'if (!PyUnicode_Check({arg})) {{')
+        self._write(f'PyErr_Format(PyExc_TypeError, '
+                    f'"{name} must be str, not %.200s", '
+                    f'Py_TYPE({arg})->tp_name);', 1)
+        self._write('goto exit;', 1)
+        self._write('}')
+
+        self._write(f'{ctype} {name};')
+        for index, (_, constant) in enumerate(choices):
+            keyword = 'if' if index == 0 else 'else if'
+            self._write(f'{keyword} ({arg} == {strs}[{index}]) {{')
+            self._write(f'{name} = {constant};', 1)
+            self._write('}')
+        self._write('else {')
+        with self.output.indent():
+            self._write(f'Py_ssize_t {name}_len = PyUnicode_GET_LENGTH({arg});')
+            for index, (literal, constant) in enumerate(choices):
+                keyword = 'if' if index == 0 else 'else if'
+                self._write(f'{keyword} ({name}_len == {len(literal)} '
+                            f'&& PyUnicode_Compare({arg}, {strs}[{index}]) == 0) {{')
+                self._write(f'{name} = {constant};', 1)
+                self._write('}')
+            literals = ', '.join(repr(literal) for literal, _ in choices)
+            literals = literals.replace('%', '%%')
+            msg = escape_string(f'{name} must be one of {literals}, not %R')
+            self._write('else {')
+            self._write(f'PyErr_Format(PyExc_ValueError, {msg}, {arg});', 1)
+            self._write('goto exit;', 1)
+            self._write('}')
+        self._write('}')
+        self._write()
+
+
+class VarArgsConverter(Converter):
+    """
+    Pass *args to the impl function.
+
+    '*args: object' passes the arguments array and its length without
+    creating a tuple. '*args: tuple' creates a tuple.
+    """
+    def __init__(self, output: Output, param: CParameter,
+                 items: str, length: str) -> None:
+        super().__init__(output, param, items)
+        self.length = length
+
+    def declare(self):
+        if self.param.type == 'tuple':
+            self._write(f'PyObject *{self.param.name}_tuple = NULL;')
+
+    def parse_param(self):
+        if self.param.type != 'tuple':
+            return
+
+        var_name = f'{self.param.name}_tuple'
+        self._write(f'{var_name} = PyTuple_New({self.length});')
+        self._write(f'if ({var_name} == NULL) {{')
+        self._write('goto exit;', 1)
+        self._write('}')
+        self._write(f'for (Py_ssize_t i = 0; i < {self.length}; i++) {{')
+        self._write(f'PyObject *item = {self.arg}[i];', 1)
+        self._write('Py_INCREF(item);', 1)
+        self._write(f'PyTuple_SET_ITEM({var_name}, i, item);', 1)
+        self._write('}')
+        self._write()
+
+    def cleanup(self):
+        if self.param.type == 'tuple':
+            self._write(f'Py_XDECREF({self.param.name}_tuple);')
+
+    def get_impl_args(self):
+        param = self.param
+        if param.type == 'tuple':
+            return [(param.ctype, param.name, f'{param.name}_tuple')]
+        return [(param.ctype, param.name, self.arg),
+                ('Py_ssize_t', f'{param.name}_length', self.length)]
+
+
 CONVERTERS = {
     'bool': BoolConverter,
     'int': IntConverter,
+    'double[]': DoubleArrayConverter,
+    'Py_ssize_t[]': SsizeArrayConverter,
 }
 
 
+def get_converter(plan_arg: ParseArg) -> type[Converter]:
+    try:
+        return plan_arg.converter
+    except AttributeError:
+        pass
+
+    param = plan_arg.param
+    converter: type[Converter] | None
+    if param.is_choice():
+        converter = ChoiceConverter
+    else:
+        converter = CONVERTERS.get(param.type, None)
+        if converter is None:
+            raise ValueError(f"no converter for type: {param.type!r}")
+    plan_arg.converter = converter
+    return converter
+
+
 def format_param_type(ctype: str, name: str) -> str:
-    if ctype == 'PyObject*':
-        return f'PyObject *{name}'
+    if ctype.endswith('*'):
+        return f'{ctype[:-1]} *{name}'
     else:
         return f'{ctype} {name}'
 
 
+def get_converters(output: Output, func: CFunction) -> list[Converter]:
+    # Converter of the ParseArg 'plan_arg' is converters[plan_arg.index]
+    calling_convention = func.calling_convention
+    converters = []
+    for plan_arg in func.plan.args:
+        converter = get_converter(plan_arg)
+        arg = calling_convention.get_arg_value(plan_arg.index)
+        converters.append(converter(output, plan_arg.param, arg))
+    varargs = func.plan.varargs
+    if varargs is not None:
+        items, length = calling_convention.get_varargs()
+        converters.append(VarArgsConverter(output, varargs, items, length))
+    return converters
+
+
+def get_impl_args(func: CFunction,
+                  converters: list[Converter]) -> list[tuple[str, str, str]]:
+    # Parameters of the impl function: list of (ctype, name, value)
+    impl_args = []
+    for param, plan_arg in zip(func.params, func.plan.param_args):
+        if plan_arg is not None:
+            impl_args.extend(converters[plan_arg.index].get_impl_args())
+        else:
+            impl_args.append((param.ctype, param.name, param.name))
+    return impl_args
+
+
 def write_impl_prototype(output: Output, func: CFunction) -> None:
     output.write('static PyObject *')
-    args = [format_param_type(param.ctype, param.name)
-            for param in func.params]
+    converters = get_converters(output, func)
+    args = [format_param_type(ctype, name)
+            for ctype, name, _ in get_impl_args(func, converters)]
     line = f'{func.impl_name}({", ".join(args)});'
     output.write(line)
 
 
 def write_impl(output: Output, func: CFunction) -> None:
     output.write('static PyObject *')
-    args = [format_param_type(param.ctype, param.name)
-            for param in func.params]
+    converters = get_converters(output, func)
+    args = [format_param_type(ctype, name)
+            for ctype, name, _ in get_impl_args(func, converters)]
     line = f'{func.impl_name}({", ".join(args)})'
     output.write(line)
 
@@ -107,32 +394,42 @@ def write_function(output: Output, func: CFunction) -> None:
     calling_convention = func.calling_convention
     calling_convention.write_prototype(output)
 
+    converters = get_converters(output, func)
+
     output.write('{')
 
     with output.indent():
         output.write('PyObject *return_value = NULL;')
+        for conv in converters:
+            conv.declare()
         calling_convention.write_nargs(output)
+        calling_convention.write_module_state(output)
         output.write()
 
         calling_convention.write_check_nargs(output)
 
-        arg_index = 0
-        for param in func.params:
-            if param.is_module():
-                continue
-            converter = CONVERTERS.get(param.type, None)
-            if converter is None:
-                raise ValueError("no converter for type: {param.type!r}")
-
-            arg = calling_convention.get_arg_value(arg_index)
-            arg_index += 1
-            conv = converter(output, param, arg)
+        for conv in converters:
             conv.parse_param()
 
-        args = ', '.join(param.name for param in func.params)
+        args = ', '.join(value
+                         for _, _, value in get_impl_args(func, converters))
         output.write(f'return_value = {func.impl_name}({args});')
 
     output.write()
     output.write('exit:')
-    output.write('return return_value;', 1)
+    with output.indent():
+        for conv in converters:
+            conv.cleanup()
+        output.write('return return_value;')
     output.write('}')
+
+
+def write_clinic(output: Output, func: CFunction) -> None:
+    # Code written into the .clinic.c file
+    write_pydoc(output, func)
+    output.write()
+    write_methoddef(output, func)
+    output.write()
+    write_impl_prototype(output, func)
+    output.write()
+    write_function(output, func)
@@ -0,0 +1,96 @@
+import json
+import os
+
+from argclinic import __version__
+from argclinic.utils import Config
+
+
+class Manifest:
+    """
+    Record the state of input files to skip unchanged files.
+
+    A file is skipped if its size and modification time are unchanged
+    (a single os.stat() call), or if its content hash is unchanged, and
+    if its output files are unchanged. All entries are ignored if the
+    generator version or the Config changed, or if the manifest is invalid.
+    """
+    def __init__(self, filename: str, config: Config) -> None:
+        self.filename = filename
+        self.version = __version__
+        self.config = config.to_dict()
+        # filename => {'size': int, 'mtime_ns': int, 'hash': str,
+        #              'outputs': {filename: {'size': int, 'mtime_ns': int}}}
+        self.files: dict[str, dict] = {}
+
+    def load(self) -> None:
+        try:
+            with open(self.filename, encoding="utf-8") as fp:
+                data = json.load(fp)
+        except FileNotFoundError:
+            return
+        except ValueError:
+            # corrupted manifest
+            return
+
+        try:
+            if (data['version'] != self.version
+                    or data['config'] != self.config):
+                return
+            files = data['files']
+            if not all(isinstance(entry, dict) for entry in files.values()):
+                raise TypeError("invalid entry")
+        except (KeyError, TypeError, AttributeError):
+            # invalid manifest
+            return
+        self.files = files
+
+    def save(self) -> None:
+        data = {
+            'version': self.version,
+            'config': self.config,
+            'files': self.files,
+        }
+        tmp = self.filename + '.tmp'
+        with open(tmp, "w", encoding="utf-8") as fp:
+            json.dump(data, fp, indent=2, sort_keys=True)
+            fp.write('\n')
+        os.replace(tmp, self.filename)
+
+    def check_stat(self, filename: str, st: os.stat_result) -> bool:
+        entry = self.files.get(filename)
+        return (entry is not None
+                and entry.get('size') == st.st_size
+                and entry.get('mtime_ns') == st.st_mtime_ns)
+
+    def check_hash(self, filename: str, content_hash: str) -> bool:
+        entry = self.files.get(filename)
+        return (entry is not None and entry.get('hash') == content_hash)
+
+    def check_outputs(self, filename: str) -> bool:
+        # Output files must not be removed or modified
+        entry = self.files.get(filename)
+        if entry is None:
+            return False
+        outputs = entry.get('outputs')
+        if not isinstance(outputs, dict) or not outputs:
+            return False
+        for output, output_stat in outputs.items():
+            try:
+                st = os.stat(output)
+            except OSError:
+                return False
+            if output_stat != _get_stat(st):
+                return False
+        return True
+
+    def update(self, filename: str, st: os.stat_result,
+               content_hash: str, outputs: list[str]) -> None:
+        entry = _get_stat(st)
+        entry['hash'] = content_hash
+        entry['outputs'] = {output: _get_stat(os.stat(output))
+                            for output in outputs}
+        self.files[filename] = entry
+
+
+def _get_stat(st: os.stat_result) -> dict:
+    return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
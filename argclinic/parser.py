@@ -1,6 +1,6 @@
 import enum
 import inspect
-from typing import Callable
+from typing import Callable, Iterable
 
 
 EMPTY = ""
@@ -9,10 +9,13 @@ EMPTY = ""
 class ParameterKind(enum.Enum):
     POSITIONAL_ONLY = inspect.Parameter.POSITIONAL_ONLY
     POSITIONAL_OR_KEYWORD = inspect.Parameter.POSITIONAL_OR_KEYWORD
+    VAR_POSITIONAL = inspect.Parameter.VAR_POSITIONAL
     KEYWORD_ONLY = inspect.Parameter.KEYWORD_ONLY
 
 
 class ParserParameter:
+    __slots__ = ('name', 'type', 'kind', 'default')
+
     def __init__(self, name: str,
                  *, type: str, kind: ParameterKind, default: str = EMPTY) -> None:
         self.name = name
@@ -22,6 +25,8 @@ class ParserParameter:
 
 
 class ParserFunction:
+    __slots__ = ('name', 'params', 'doc')
+
     def __init__(self, name = "") -> None:
         self.name = name
         self.params: list[ParserParameter] = []
@@ -35,10 +40,13 @@ class ParserFunction:
 
     def set_params_to_pos_only(self):
         for arg in self.params:
-            arg.kind = ParameterKind.POSITIONAL_ONLY
+            if arg.kind != ParameterKind.VAR_POSITIONAL:
+                arg.kind = ParameterKind.POSITIONAL_ONLY
 
 
 class ParseFunction:
+    __slots__ = ('func', 'param_kind', '_parse_func')
+
     def __init__(self) -> None:
         self.func = ParserFunction()
         self.param_kind = ParameterKind.POSITIONAL_OR_KEYWORD
@@ -75,7 +83,14 @@ class ParseFunction:
             argtype = argtype.strip()
             default = default.strip()
 
-        arg = ParserParameter(name, type=argtype, kind=self.param_kind, default=default)
+        kind = self.param_kind
+        if name.startswith("*"):
+            # '*args: type'
+            name = name[1:]
+            kind = ParameterKind.VAR_POSITIONAL
+            self.param_kind = ParameterKind.KEYWORD_ONLY
+
+        arg = ParserParameter(name, type=argtype, kind=kind, default=default)
         self.func.params.append(arg)
 
     def _parse_empty_line(self, line: str) -> None:
@@ -92,6 +107,87 @@ class ParseFunction:
             try:
                 self._parse_func(line)
             except Exception as exc:
-                what = filename if filename else "<string>"
-                raise Exception(f"failed to parse {what} at line {lineno}: {exc}")
+                raise _parse_error(filename, lineno, str(exc))
         return self.func
+
+
+def _parse_error(filename: str | None, lineno: int, msg: str) -> Exception:
+    what = filename if filename else "<string>"
+    return Exception(f"failed to parse {what} at line {lineno}: {msg}")
+
+
+def parse_function(text: str, filename: str | None = None,
+                   first_lineno: int = 1) -> ParserFunction:
+    """
+    Parse a clinic input block.
+
+    Faster than ParseFunction().parse() and gives the same result.
+    first_lineno is the line number of the first line of the block in
+    filename, used in error messages.
+    """
+    lines = text.splitlines()
+    nline = len(lines)
+    func = ParserFunction(lines[0] if lines else "")
+    if nline < 2:
+        return func
+
+    line = lines[1]
+    if line:
+        raise _parse_error(filename, first_lineno + 1,
+                           f"expect empty line, got: {line!r}")
+
+    params = func.params
+    kind = ParameterKind.POSITIONAL_OR_KEYWORD
+    index = 2
+    while index < nline:
+        line = lines[index].strip()
+        index += 1
+        if not line:
+            break
+
+        if line == "/":
+            for param in params:
+                if param.kind != ParameterKind.VAR_POSITIONAL:
+                    param.kind = ParameterKind.POSITIONAL_ONLY
+            continue
+
+        if line == "*":
+            kind = ParameterKind.KEYWORD_ONLY
+            continue
+
+        name, sep, argtype = line.partition(': ')
+        if not sep:
+            raise _parse_error(filename, first_lineno + index - 1,
+                               f"expect 'name: type' argument, got {line!r}")
+        argtype, sep, default = argtype.strip().partition(' = ')
+        if sep:
+            argtype = argtype.strip()
+            default = default.strip()
+        else:
+            default = EMPTY
+        name = name.strip()
+        if name.startswith("*"):
+            # '*args: type'
+            params.append(ParserParameter(name[1:], type=argtype,
+                                          kind=ParameterKind.VAR_POSITIONAL,
+                                          default=default))
+            kind = ParameterKind.KEYWORD_ONLY
+            continue
+        params.append(ParserParameter(name, type=argtype,
+                                      kind=kind, default=default))
+
+    # ParserFunction.add_doc_line() ignores leading empty lines
+    while index < nline and not lines[index]:
+        index += 1
+    func.doc = "\n".join(lines[index:])
+    return func
+
+
+def parse_functions(texts: Iterable[str],
+                    filename: str | None = None,
+                    first_linenos: Iterable[int] | None = None
+                    ) -> list[ParserFunction]:
+    if first_linenos is None:
+        return [parse_function(text, filename) for text in texts]
+    return [parse_function(text, filename, first_lineno)
+            for text, first_lineno in zip(texts, first_linenos, strict=True)]
@@ -0,0 +1,60 @@
+from argclinic.utils import Output
+from argclinic.cfunction import CFunction
+from argclinic.clanguage import write_clinic
+
+
+TOTAL_KEYS = ('lines', 'bytes', 'converters', 'error_branches')
+
+
+def get_signature(func: CFunction) -> tuple:
+    # Functions with the same signature have the same argument parsing code
+    plan = func.plan
+    return (plan.convention,
+            tuple(param.type for param in func.params),
+            plan.min_nargs)
+
+
+def get_function_report(func: CFunction) -> dict:
+    output = Output()
+    write_clinic(output, func)
+    lines = output.output
+
+    plan = func.plan
+    converters = len(plan.args)
+    if plan.varargs is not None:
+        converters += 1
+    return {
+        'name': func.name,
+        'lines': len(lines),
+        'bytes': sum(len(line.encode("utf-8")) + 1 for line in lines),
+        'calling_convention': func.calling_convention.name,
+        'converters': converters,
+        'error_branches': sum(1 for line in lines
+                              if line.strip() == 'goto exit;'),
+    }
+
+
+def get_file_report(filename: str, funcs: list[CFunction]) -> dict:
+    """
+    Report the size of the code generated for each function of a file.
+    """
+    signatures: dict[tuple, int] = {}
+    for func in funcs:
+        signature = get_signature(func)
+        signatures[signature] = signatures.get(signature, 0) + 1
+
+    functions = []
+    total = dict.fromkeys(TOTAL_KEYS, 0)
+    for func in funcs:
+        report = get_function_report(func)
+        report['shared_signature'] = (signatures[get_signature(func)] > 1)
+        for key in TOTAL_KEYS:
+            total[key] += report[key]
+        functions.append(report)
+    total['functions'] = len(functions)
+
+    return {
+        'filename': filename,
+        'functions': functions,
+        'total': total,
+    }
@@ -1,14 +1,15 @@
 from argclinic.utils import Config
 from argclinic.parser import ParameterKind, ParserFunction, ParserParameter
 from argclinic.cfunction import (
-    CFunction, CParameter, get_cfunction, get_text_signature,
-    MODULE_PARAM)
+    CFunction, CParameter, Convention, get_cfunction, get_text_signature,
+    parse_choice_type, MODULE_PARAM)
 import unittest
 
 
 CONFIG = Config()
 POSITIONAL_ONLY = ParameterKind.POSITIONAL_ONLY
 POSITIONAL_OR_KEYWORD = ParameterKind.POSITIONAL_OR_KEYWORD
+VAR_POSITIONAL = ParameterKind.VAR_POSITIONAL
 
 
 class FromParserTests(unittest.TestCase):
@@ -58,6 +59,30 @@ class CFunctionTests(unittest.TestCase):
         func = CFunction(CONFIG, "func", params)
         self.assertEqual(func.calling_convention.name, "METH_VARARGS")
 
+        # METH_FASTCALL
+        params = [MODULE_PARAM,
+                  CParameter("arg", type="object", kind=POSITIONAL_ONLY),
+                  CParameter("args", type="object", kind=VAR_POSITIONAL)]
+        func = CFunction(CONFIG, "func", params)
+        self.assertEqual(func.calling_convention.name, "METH_FASTCALL")
+        self.assertIs(func.plan.varargs, params[2])
+        # the varargs start after the positional arguments
+        self.assertEqual([(plan_arg.index, plan_arg.param)
+                          for plan_arg in func.plan.param_args[1:]],
+                         [(0, params[1]), (1, params[2])])
+        self.assertEqual(func.get_min_max_args(), (1, 1))
+        self.assertEqual(func.calling_convention.get_varargs(),
+                         ('args + 1', 'nargs - 1'))
+
+        # the module state doesn't change the calling convention
+        params = [MODULE_PARAM,
+                  CParameter("state", type="module_state(mod_state)",
+                             kind=POSITIONAL_ONLY)]
+        func = CFunction(CONFIG, "func", params)
+        self.assertEqual(func.calling_convention.name, "METH_NOARGS")
+        self.assertIs(func.plan.module_state, params[1])
+        self.assertEqual(params[1].ctype, "mod_state*")
+
     def test_signature(self):
         # 0 params
         func = CFunction(CONFIG, "getuid", [MODULE_PARAM])
@@ -83,6 +108,20 @@ class CFunctionTests(unittest.TestCase):
         func = CFunction(CONFIG, "setns", params)
         self.assertEqual(get_text_signature(func), 'setns($module, /, fd, nstype=0)')
 
+        # the module state is not a Python argument
+        params = [MODULE_PARAM,
+                  CParameter('state', type='module_state(mod_state)',
+                             kind=POSITIONAL_ONLY),
+                  CParameter('fd', type='int', kind=POSITIONAL_ONLY)]
+        func = CFunction(CONFIG, "get_fd", params)
+        self.assertEqual(get_text_signature(func), 'get_fd($module, fd, /)')
+
+        # *args
+        params = [MODULE_PARAM,
+                  CParameter('values', type='object', kind=VAR_POSITIONAL)]
+        func = CFunction(CONFIG, "pack", params)
+        self.assertEqual(get_text_signature(func), 'pack($module, /, *values)')
+
     def test_get_min_max_args(self):
         # 0 params
         func = CFunction(CONFIG, "func", [MODULE_PARAM])
@@ -108,6 +147,92 @@ class CFunctionTests(unittest.TestCase):
         func = CFunction(CONFIG, "func", params)
         self.assertEqual(func.get_min_max_args(), (1, 2))
 
+    def test_parse_plan(self):
+        arg = CParameter("arg", type="object", kind=POSITIONAL_ONLY)
+        arg2 = CParameter("arg2", type="int", kind=POSITIONAL_ONLY, default="2")
+        func = CFunction(CONFIG, "func", [MODULE_PARAM, arg, arg2])
+        plan = func.plan
+        self.assertIs(plan.convention, Convention.VARARGS)
+        self.assertIs(func.calling_convention.kind, Convention.VARARGS)
+        self.assertEqual([(plan_arg.index, plan_arg.param)
+                          for plan_arg in plan.args],
+                         [(0, arg), (1, arg2)])
+        self.assertEqual((plan.min_nargs, plan.max_nargs), (1, 2))
+        self.assertEqual(plan.param_args, (None,) + plan.args)
+
+        # the IR doesn't have a __dict__
+        with self.assertRaises(AttributeError):
+            func.attr = 1
+        with self.assertRaises(AttributeError):
+            arg.attr = 1
+
+        # the IR is read-only
+        with self.assertRaises(AttributeError):
+            func.doc = "doc"
+        with self.assertRaises(AttributeError):
+            arg.type = "int"
+        with self.assertRaises(AttributeError):
+            plan.min_nargs = 0
+        with self.assertRaises(AttributeError):
+            plan.args[0].index = 1
+        with self.assertRaises(AttributeError):
+            func.calling_convention.kind = Convention.O
+        with self.assertRaises(AttributeError):
+            del func.name
+
+    def test_defining_class(self):
+        # METH_METHOD is not allowed for module functions
+        params = [MODULE_PARAM,
+                  CParameter("cls", type="defining_class", kind=POSITIONAL_ONLY),
+                  CParameter("arg", type="object", kind=POSITIONAL_ONLY)]
+        with self.assertRaises(ValueError):
+            CFunction(CONFIG, "func", params)
+
+    def test_module_state_errors(self):
+        for invalid in ('module_state(mod_state', 'module_state()'):
+            with self.subTest(invalid=invalid):
+                with self.assertRaises(ValueError):
+                    CParameter("state", type=invalid, kind=POSITIONAL_ONLY)
+
+    def test_varargs_errors(self):
+        with self.assertRaises(ValueError):
+            CParameter("args", type="int", kind=VAR_POSITIONAL)
+
+        params = [MODULE_PARAM,
+                  CParameter("args", type="object", kind=VAR_POSITIONAL),
+                  CParameter("flag", type="bool", kind=ParameterKind.KEYWORD_ONLY)]
+        with self.assertRaises(ValueError):
+            CFunction(CONFIG, "func", params)
+
+        # optional parameter before *args
+        params = [MODULE_PARAM,
+                  CParameter("a", type="int", kind=POSITIONAL_ONLY, default="0"),
+                  CParameter("args", type="object", kind=VAR_POSITIONAL)]
+        with self.assertRaises(ValueError):
+            CFunction(CONFIG, "func", params)
+
+    def test_parse_choice_type(self):
+        self.assertEqual(
+            parse_choice_type('choice(open_mode, "r"=MODE_READ, "r+"=MODE_UPDATE)'),
+            ('open_mode', [('r', 'MODE_READ'), ('r+', 'MODE_UPDATE')]))
+
+        param = CParameter("mode", type='choice(open_mode, "r"=MODE_READ)',
+                           kind=POSITIONAL_ONLY)
+        self.assertEqual(param.ctype, "open_mode")
+        self.assertTrue(param.is_choice())
+
+        with self.assertRaises(ValueError):
+            CParameter("mode", type='choice(open_mode, "r"',
+                       kind=POSITIONAL_ONLY)
+
+        for invalid in ('choice()', 'choice(open_mode)',
+                        'choice(open_mode, r=MODE_READ)',
+                        'choice(open_mode, "r" = MODE_READ)',
+                        'choice("r"=MODE_READ)'):
+            with self.subTest(invalid=invalid):
+                with self.assertRaises(ValueError):
+                    parse_choice_type(invalid)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,9 +1,10 @@
 from argclinic.utils import Config
-from argclinic.parser import ParameterKind
-from argclinic.cfunction import MODULE_PARAM, CFunction, CParameter
+from argclinic.parser import ParameterKind, parse_function
+from argclinic.cfunction import (
+    MODULE_PARAM, CFunction, CParameter, get_cfunction)
 from argclinic.clanguage import (
     escape_string, Output, write_pydoc, write_methoddef, write_function,
-    write_impl_prototype)
+    write_impl_prototype, get_converter, IntConverter, BoolConverter)
 import unittest
 
 
@@ -19,13 +20,14 @@ class Tests(unittest.TestCase):
                          '"abc"')
         self.assertEqual(escape_string('Hello "World".'),
                          '"Hello \\"World\\"."')
+        self.assertEqual(escape_string('a\\b\n'),
+                         '"a\\\\b\\n"')
 
     def create_func(self):
         params = [MODULE_PARAM,
                   CParameter('fd', type='int', kind=POSITIONAL_ONLY)]
-        func = CFunction(CONFIG, "get_fd", params)
-        func.doc = "Documentation.\nMultiline."
-        return func
+        return CFunction(CONFIG, "get_fd", params,
+                         doc="Documentation.\nMultiline.")
 
     def test_write_pydoc(self):
         func = self.create_func()
@@ -109,6 +111,256 @@ class Tests(unittest.TestCase):
              '    return return_value;',
              '}'])
 
+    def test_write_function_module_state(self):
+        params = [MODULE_PARAM,
+                  CParameter('state', type='module_state(mod_state)',
+                             kind=POSITIONAL_ONLY)]
+        func = CFunction(CONFIG, "count", params)
+        output = Output()
+        write_impl_prototype(output, func)
+        write_function(output, func)
+
+        self.assertEqual(output.output,
+            ['static PyObject *',
+             'count_impl(PyObject *module, mod_state *state);',
+             'static PyObject *',
+             'count(PyObject *module, PyObject *Py_UNUSED(ignored))',
+             '{',
+             '    PyObject *return_value = NULL;',
+             '    mod_state *state = (mod_state *)PyModule_GetState(module);',
+             '    if (state == NULL) {',
+             '        if (!PyErr_Occurred()) {',
+             '            PyErr_SetString(PyExc_SystemError, "count: module has no state");',
+             '        }',
+             '        goto exit;',
+             '    }',
+             '',
+             '    return_value = count_impl(module, state);',
+             '',
+             'exit:',
+             '    return return_value;',
+             '}'])
+
+    def test_write_function_array(self):
+        params = [MODULE_PARAM,
+                  CParameter('values', type='double[]', kind=POSITIONAL_ONLY)]
+        func = CFunction(CONFIG, "fsum", params)
+        output = Output()
+        write_impl_prototype(output, func)
+        write_function(output, func)
+
+        self.assertEqual(output.output,
+            ['static PyObject *',
+             'fsum_impl(PyObject *module, double *values, Py_ssize_t values_length);',
+             'static PyObject *',
+             'fsum(PyObject *module, PyObject *arg)',
+             '{',
+             '    PyObject *return_value = NULL;',
+             '    double values_stack[16];',
+             '    double *values = values_stack;',
+             '    Py_ssize_t values_length = 0;',
+             '',
+             '    PyObject *values_seq = arg;',
+             '    if (!PyList_Check(values_seq) && !PyTuple_Check(values_seq)) {',
+             '        PyErr_Format(PyExc_TypeError, "values must be a list or a tuple, not %.200s", Py_TYPE(values_seq)->tp_name);',
+             '        goto exit;',
+             '    }',
+             '    values_length = PySequence_Fast_GET_SIZE(values_seq);',
+             '    if (values_length > 16) {',
+             '        values = PyMem_New(double, values_length);',
+             '        if (values == NULL) {',
+             '            PyErr_NoMemory();',
+             '            goto exit;',
+             '        }',
+             '    }',
+             '    for (Py_ssize_t i = 0; i < values_length; i++) {',
+             '        if (i >= PySequence_Fast_GET_SIZE(values_seq)) {',
+             '            PyErr_SetString(PyExc_RuntimeError, "values changed size during conversion");',
+             '            goto exit;',
+             '        }',
+             '        PyObject *item = PySequence_Fast_GET_ITEM(values_seq, i);',
+             '        if (PyFloat_CheckExact(item)) {',
+             '            values[i] = PyFloat_AS_DOUBLE(item);',
+             '        }',
+             '        else {',
+             '            Py_INCREF(item);',
+             '            values[i] = PyFloat_AsDouble(item);',
+             '            Py_DECREF(item);',
+             '            if (values[i] == -1 && PyErr_Occurred()) {',
+             '                goto exit;',
+             '            }',
+             '        }',
+             '    }',
+             '',
+             '    return_value = fsum_impl(module, values, values_length);',
+             '',
+             'exit:',
+             '    if (values != values_stack) {',
+             '        PyMem_Free(values);',
+             '    }',
+             '    return return_value;',
+             '}'])
+
+        # Py_ssize_t[] converter
+        params = [MODULE_PARAM,
+                  CParameter('sizes', type='Py_ssize_t[]', kind=POSITIONAL_ONLY)]
+        func = CFunction(CONFIG, "total", params)
+        output = Output()
+        write_function(output, func)
+        self.assertIn('    Py_ssize_t sizes_stack[16];', output.output)
+        self.assertIn('        if (PyLong_CheckExact(item)) {', output.output)
+        self.assertIn('            sizes[i] = PyNumber_AsSsize_t(item, PyExc_OverflowError);',
+                      output.output)
+
+    def test_write_function_choice(self):
+        params = [MODULE_PARAM,
+                  CParameter('mode', type='choice(open_mode, "r"=MODE_READ, "wb"=MODE_WRITE)',
+                             kind=POSITIONAL_ONLY)]
+        func = CFunction(CONFIG, "open", params)
+        output = Output()
+        write_function(output, func)
+        lines = output.output
+        start = lines.index('    open_mode mode;')
+        end = lines.index('    return_value = open_impl(module, mode);')
+        self.assertEqual(lines[start:end],
+            ['    open_mode mode;',
+             '    if (mode_str == mode_choices[0]) {',
+             '        mode = MODE_READ;',
+             '    }',
+             '    else if (mode_str == mode_choices[1]) {',
+             '        mode = MODE_WRITE;',
+             '    }',
+             '    else {',
+             '        Py_ssize_t mode_len = PyUnicode_GET_LENGTH(mode_str);',
+             '        if (mode_len == 1 && PyUnicode_Compare(mode_str, mode_choices[0]) == 0) {',
+             '            mode = MODE_READ;',
+             '        }',
+             '        else if (mode_len == 2 && PyUnicode_Compare(mode_str, mode_choices[1]) == 0) {',
+             '            mode = MODE_WRITE;',
+             '        }',
+             '        else {',
+             '            PyErr_Format(PyExc_ValueError, "mode must be one of \'r\', \'wb\', not %R", mode_str);',
+             '            goto exit;',
+             '        }',
+             '    }',
+             ''])
+        start = lines.index('    static PyObject *mode_choices[2];')
+        self.assertEqual(lines[start:start + 17],
+            ['    static PyObject *mode_choices[2];',
+             '    if (mode_choices[0] == NULL) {',
+             '        static const char *const mode_literals[2] = {"r", "wb"};',
+             '        PyObject *mode_interned[2];',
+             '        for (Py_ssize_t i = 0; i < 2; i++) {',
+             '            mode_interned[i] = PyUnicode_InternFromString(mode_literals[i]);',
+             '            if (mode_interned[i] == NULL) {',
+             '                while (--i >= 0) {',
+             '                    Py_DECREF(mode_interned[i]);',
+             '                }',
+             '                goto exit;',
+             '            }',
+             '        }',
+             '        for (Py_ssize_t i = 0; i < 2; i++) {',
+             '            mode_choices[i] = mode_interned[i];',
+             '        }',
+             '    }'])
+
+    def test_choice_from_parser(self):
+        parser_func = parse_function(
+            'set_sep\n'
+            '\n'
+            '    sep: choice(sep_t, "/"=SEP_SLASH, "\\"=SEP_BACKSLASH) = "/"\n'
+            '    /\n')
+        func = get_cfunction(CONFIG, parser_func)
+        self.assertEqual(func.params[1].default, '"/"')
+        output = Output()
+        write_function(output, func)
+        lines = output.output
+        # the C literal "\\" is 1 character long
+        self.assertIn('        static const char *const sep_literals[2] = {"/", "\\\\"};',
+                      lines)
+        self.assertIn('        else if (sep_len == 1 && PyUnicode_Compare(sep_str, sep_choices[1]) == 0) {',
+                      lines)
+
+        # spaces around '=' are parsed as a default value
+        parser_func = parse_function(
+            'set_mode\n'
+            '\n'
+            '    mode: choice(mode_t, "r" = MODE_READ)\n')
+        with self.assertRaises(ValueError):
+            get_cfunction(CONFIG, parser_func)
+
+    def test_write_function_varargs(self):
+        params = [MODULE_PARAM,
+                  CParameter('fd', type='int', kind=POSITIONAL_ONLY),
+                  CParameter('values', type='object',
+                             kind=ParameterKind.VAR_POSITIONAL)]
+        func = CFunction(CONFIG, "pack", params)
+        output = Output()
+        write_methoddef(output, func)
+        write_impl_prototype(output, func)
+        write_function(output, func)
+
+        self.assertEqual(output.output,
+            ['#define PACK_METHODDEF    \\',
+             '    {"pack", (PyCFunction)(void(*)(void))pack, METH_FASTCALL, pack__doc__},',
+             'static PyObject *',
+             'pack_impl(PyObject *module, int fd, PyObject *const *values, Py_ssize_t values_length);',
+             'static PyObject *',
+             'pack(PyObject *module, PyObject *const *args, Py_ssize_t nargs)',
+             '{',
+             '    PyObject *return_value = NULL;',
+             '',
+             '    if (nargs < 1) {',
+             '        PyErr_Format(PyExc_TypeError, "pack expected at least 1 arguments, got %zd", nargs);',
+             '        goto exit;',
+             '    }',
+             '',
+             '    int fd = PyLong_AsInt(args[0]);',
+             '    if (fd == -1 && PyErr_Occurred()) {',
+             '        goto exit;',
+             '    }',
+             '',
+             '    return_value = pack_impl(module, fd, args + 1, nargs - 1);',
+             '',
+             'exit:',
+             '    return return_value;',
+             '}'])
+
+    def test_write_function_varargs_tuple(self):
+        params = [MODULE_PARAM,
+                  CParameter('args', type='tuple',
+                             kind=ParameterKind.VAR_POSITIONAL)]
+        func = CFunction(CONFIG, "pack", params)
+        output = Output()
+        write_impl_prototype(output, func)
+        write_function(output, func)
+
+        self.assertEqual(output.output,
+            ['static PyObject *',
+             'pack_impl(PyObject *module, PyObject *args);',
+             'static PyObject *',
+             'pack(PyObject *module, PyObject *const *args, Py_ssize_t nargs)',
+             '{',
+             '    PyObject *return_value = NULL;',
+             '    PyObject *args_tuple = NULL;',
+             '',
+             '    args_tuple = PyTuple_New(nargs);',
+             '    if (args_tuple == NULL) {',
+             '        goto exit;',
+             '    }',
+             '    for (Py_ssize_t i = 0; i < nargs; i++) {',
+             '        PyObject *item = args[i];',
+             '        Py_INCREF(item);',
+             '        PyTuple_SET_ITEM(args_tuple, i, item);',
+             '    }',
+             '',
+             '    return_value = pack_impl(module, args_tuple);',
+             '',
+             'exit:',
+             '    Py_XDECREF(args_tuple);',
+             '    return return_value;',
+             '}'])
+
     def test_write_impl_prototype(self):
         # 1 param
         params = [MODULE_PARAM,
@@ -131,6 +383,21 @@ class Tests(unittest.TestCase):
             ['static PyObject *',
              'get_fds_impl(PyObject *module, int fd, bool arg);'])
 
+    def test_get_converter(self):
+        params = [MODULE_PARAM,
+                  CParameter('fd', type='int', kind=POSITIONAL_ONLY),
+                  CParameter('arg', type='bool', kind=POSITIONAL_ONLY)]
+        func = CFunction(CONFIG, "get_fds", params)
+        fd_arg, bool_arg = func.plan.args
+        self.assertIs(get_converter(fd_arg), IntConverter)
+        self.assertIs(get_converter(bool_arg), BoolConverter)
+
+        # the converter class is cached in the read-only ParseArg
+        self.assertIs(fd_arg.converter, IntConverter)
+        self.assertIs(get_converter(fd_arg), IntConverter)
+        with self.assertRaises(AttributeError):
+            fd_arg.converter = BoolConverter
+
 
 if __name__ == "__main__":
     unittest.main()
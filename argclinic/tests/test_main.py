@@ -0,0 +1,57 @@
+from argclinic.utils import Config, hash_text
+from argclinic.__main__ import get_blocks, generate
+import os
+import tempfile
+import unittest
+
+
+CODE = """int x;
+
+/*[clinic input]
+get_fd
+
+    fd: int
+    /
+
+Doc.
+[clinic start generated code]*/
+"""
+BLOCK = "get_fd\n\n    fd: int\n    /\n\nDoc."
+
+
+class Tests(unittest.TestCase):
+    def test_get_blocks(self):
+        lines = CODE.splitlines(keepends=True)
+        self.assertEqual(get_blocks(lines), [(9, 4, BLOCK)])
+
+    def test_generate(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        filename = os.path.join(tmpdir.name, "file.c")
+        filename2 = os.path.join(tmpdir.name, "file2.c")
+        filename3 = os.path.join(tmpdir.name, "file2.clinic.c")
+
+        generate(Config(), filename, CODE, filename2, filename3)
+        with open(filename2) as fp:
+            lines = fp.read().splitlines()
+        self.assertEqual(lines[:10], CODE.splitlines())
+        self.assertEqual(lines[10:12],
+                         ['static PyObject *',
+                          'get_fd_impl(PyObject *module, int fd)'])
+        self.assertEqual(lines[12].split()[-1], f'input={hash_text(BLOCK)}]*/')
+
+        with open(filename3) as fp:
+            clinic = fp.read()
+        self.assertIn('"Doc.");', clinic)
+
+    def test_generate_error(self):
+        code = CODE.replace("    fd: int", "    fd int")
+        with self.assertRaises(Exception) as cm:
+            generate(Config(), "file.c", code, os.devnull, os.devnull)
+        self.assertEqual(str(cm.exception),
+                         "failed to parse file.c at line 6: "
+                         "expect 'name: type' argument, got 'fd int'")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+from argclinic.utils import Config, hash_text
+from argclinic.manifest import Manifest
+import json
+import os
+import tempfile
+import unittest
+
+
+class Tests(unittest.TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.manifest_filename = os.path.join(tmpdir.name, "manifest.json")
+        self.filename = os.path.join(tmpdir.name, "file.c")
+        with open(self.filename, "w") as fp:
+            fp.write("content")
+        self.output = os.path.join(tmpdir.name, "file.clinic.c")
+        with open(self.output, "w") as fp:
+            fp.write("output")
+
+    def test_manifest(self):
+        config = Config()
+        st = os.stat(self.filename)
+        content_hash = hash_text("content")
+
+        manifest = Manifest(self.manifest_filename, config)
+        manifest.load()
+        self.assertFalse(manifest.check_stat(self.filename, st))
+        self.assertFalse(manifest.check_hash(self.filename, content_hash))
+        self.assertFalse(manifest.check_outputs(self.filename))
+        manifest.update(self.filename, st, content_hash, [self.output])
+        manifest.save()
+
+        manifest = Manifest(self.manifest_filename, config)
+        manifest.load()
+        self.assertTrue(manifest.check_stat(self.filename, st))
+        self.assertTrue(manifest.check_hash(self.filename, content_hash))
+        self.assertTrue(manifest.check_outputs(self.filename))
+        self.assertFalse(manifest.check_hash(self.filename, hash_text("new")))
+
+        # file modified
+        os.utime(self.filename, ns=(st.st_atime_ns, st.st_mtime_ns + 1))
+        self.assertFalse(manifest.check_stat(self.filename, os.stat(self.filename)))
+
+    def test_config_changed(self):
+        st = os.stat(self.filename)
+        manifest = Manifest(self.manifest_filename, Config())
+        manifest.update(self.filename, st, hash_text("content"), [self.output])
+        manifest.save()
+
+        config = Config()
+        config.min_python_ver = (3, 13)
+        manifest = Manifest(self.manifest_filename, config)
+        manifest.load()
+        self.assertFalse(manifest.check_stat(self.filename, st))
+
+    def test_outputs_changed(self):
+        st = os.stat(self.filename)
+        manifest = Manifest(self.manifest_filename, Config())
+        manifest.update(self.filename, st, hash_text("content"), [self.output])
+        self.assertTrue(manifest.check_outputs(self.filename))
+
+        # output modified
+        with open(self.output, "w") as fp:
+            fp.write("modified output")
+        self.assertFalse(manifest.check_outputs(self.filename))
+
+        # output removed
+        os.unlink(self.output)
+        self.assertFalse(manifest.check_outputs(self.filename))
+
+    def test_invalid_manifest(self):
+        config = Config()
+        valid = {'version': Manifest(self.manifest_filename, config).version,
+                 'config': config.to_dict()}
+        for content in ('garbage', '[]', json.dumps(valid),
+                        json.dumps(dict(valid, files=[])),
+                        json.dumps(dict(valid, files={'file.c': 1}))):
+            with self.subTest(content=content):
+                with open(self.manifest_filename, "w") as fp:
+                    fp.write(content)
+                manifest = Manifest(self.manifest_filename, config)
+                manifest.load()
+                self.assertEqual(manifest.files, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
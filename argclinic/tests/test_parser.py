@@ -1,19 +1,24 @@
-from argclinic.parser import ParseFunction, ParserFunction, ParserParameter, ParameterKind, EMPTY
+from argclinic.parser import (
+    ParseFunction, ParserFunction, ParserParameter, ParameterKind, EMPTY,
+    parse_function, parse_functions)
 from textwrap import dedent
 import unittest
 
 
 POSITIONAL_OR_KEYWORD = ParameterKind.POSITIONAL_OR_KEYWORD
 POSITIONAL_ONLY = ParameterKind.POSITIONAL_ONLY
+VAR_POSITIONAL = ParameterKind.VAR_POSITIONAL
 KEYWORD_ONLY = ParameterKind.KEYWORD_ONLY
 
 
-def parse_func(text):
-    text = dedent(text).strip()
-    return ParseFunction().parse(text)
+class ParseFuncTests(unittest.TestCase):
+    def parse(self, text, filename=None):
+        return ParseFunction().parse(text, filename)
 
+    def parse_func(self, text):
+        text = dedent(text).strip()
+        return self.parse(text)
 
-class ParseFuncTests(unittest.TestCase):
     def check_arg(self, arg, expected):
         self.assertEqual(arg.name, expected.name)
         self.assertEqual(arg.type, expected.type)
@@ -27,7 +32,7 @@ class ParseFuncTests(unittest.TestCase):
             self.check_arg(func_arg, expected_arg)
 
     def test_parser(self):
-        func = parse_func("""
+        func = self.parse_func("""
             get_fd
 
                 fd: int
@@ -39,7 +44,7 @@ class ParseFuncTests(unittest.TestCase):
         self.check_func(func, expected)
 
     def test_pos_only(self):
-        func = parse_func("""
+        func = self.parse_func("""
             get_fd
 
                 fd: int
@@ -55,7 +60,7 @@ class ParseFuncTests(unittest.TestCase):
         self.check_func(func, expected)
 
     def test_default(self):
-        func = parse_func("""
+        func = self.parse_func("""
             dup2
 
                 fd1: int
@@ -70,7 +75,7 @@ class ParseFuncTests(unittest.TestCase):
         self.check_func(func, expected)
 
     def test_default(self):
-        func = parse_func("""
+        func = self.parse_func("""
             os.stat
 
                 path : path_t
@@ -91,6 +96,69 @@ class ParseFuncTests(unittest.TestCase):
         ]
         self.check_func(func, expected)
 
+    def test_varargs(self):
+        func = self.parse_func("""
+            pack
+
+                fmt: str
+                /
+                *values: object
+                flag: bool = False
+        """)
+        expected = ParserFunction("pack")
+        expected.params = [
+            ParserParameter("fmt", type="str", kind=POSITIONAL_ONLY),
+            ParserParameter("values", type="object", kind=VAR_POSITIONAL),
+            ParserParameter("flag", type="bool", default="False",
+                            kind=KEYWORD_ONLY),
+        ]
+        self.check_func(func, expected)
+
+    def test_doc(self):
+        func = self.parse("func\n\n    x: int\n\n\nFirst.\n\n  Second.\n")
+        self.assertEqual(func.doc, "First.\n\n  Second.")
+
+    def test_errors(self):
+        with self.assertRaises(Exception) as cm:
+            self.parse("func\nx: int")
+        self.assertEqual(str(cm.exception),
+                         "failed to parse <string> at line 2: "
+                         "expect empty line, got: 'x: int'")
+
+        with self.assertRaises(Exception) as cm:
+            self.parse("func\n\n    x: int\n    y int\n", "file.c")
+        self.assertEqual(str(cm.exception),
+                         "failed to parse file.c at line 4: "
+                         "expect 'name: type' argument, got 'y int'")
+
+
+class FastParserTests(ParseFuncTests):
+    def parse(self, text, filename=None):
+        return parse_function(text, filename)
+
+    def test_parse_functions(self):
+        funcs = parse_functions(["func1\n\n    x: int",
+                                 "func2\n\n    y: bool = True\n    /"])
+        self.assertEqual([func.name for func in funcs], ["func1", "func2"])
+        self.assertEqual(funcs[0].params[0].kind, POSITIONAL_OR_KEYWORD)
+        self.assertEqual(funcs[1].params[0].default, "True")
+        self.assertEqual(funcs[1].params[0].kind, POSITIONAL_ONLY)
+
+    def test_first_lineno(self):
+        with self.assertRaises(Exception) as cm:
+            parse_functions(["func1\n\n    x: int",
+                             "func2\n\n    x: int\n    y int"],
+                            "file.c", [3, 10])
+        self.assertEqual(str(cm.exception),
+                         "failed to parse file.c at line 13: "
+                         "expect 'name: type' argument, got 'y int'")
+
+        with self.assertRaises(Exception) as cm:
+            parse_function("func\nx: int", "file.c", 5)
+        self.assertEqual(str(cm.exception),
+                         "failed to parse file.c at line 6: "
+                         "expect empty line, got: 'x: int'")
+
 
 if __name__ == "__main__":
     unittest.main()
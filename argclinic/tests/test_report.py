@@ -0,0 +1,52 @@
+from argclinic.utils import Config
+from argclinic.parser import ParameterKind
+from argclinic.cfunction import MODULE_PARAM, CFunction, CParameter
+from argclinic.report import get_file_report
+import unittest
+
+
+CONFIG = Config()
+POSITIONAL_ONLY = ParameterKind.POSITIONAL_ONLY
+
+
+class Tests(unittest.TestCase):
+    def test_file_report(self):
+        funcs = [
+            CFunction(CONFIG, "get_fd", [
+                MODULE_PARAM,
+                CParameter('fd', type='int', kind=POSITIONAL_ONLY)]),
+            CFunction(CONFIG, "close", [
+                MODULE_PARAM,
+                CParameter('fd', type='int', kind=POSITIONAL_ONLY)]),
+            CFunction(CONFIG, "get_fds", [
+                MODULE_PARAM,
+                CParameter('fd', type='int', kind=POSITIONAL_ONLY),
+                CParameter('arg', type='bool', kind=POSITIONAL_ONLY)]),
+        ]
+        report = get_file_report("file.c", funcs)
+        self.assertEqual(report['filename'], "file.c")
+
+        get_fd, close, get_fds = report['functions']
+        self.assertEqual(get_fd['name'], 'get_fd')
+        self.assertEqual(get_fd['calling_convention'], 'METH_O')
+        self.assertEqual(get_fd['converters'], 1)
+        self.assertEqual(get_fd['error_branches'], 1)
+        self.assertEqual(get_fd['lines'], 26)
+        self.assertTrue(get_fd['shared_signature'])
+        self.assertTrue(close['shared_signature'])
+
+        self.assertEqual(get_fds['calling_convention'], 'METH_VARARGS')
+        self.assertEqual(get_fds['converters'], 2)
+        # nargs checks and 2 converters
+        self.assertEqual(get_fds['error_branches'], 4)
+        self.assertFalse(get_fds['shared_signature'])
+
+        total = report['total']
+        self.assertEqual(total['functions'], 3)
+        for key in ('lines', 'bytes', 'converters', 'error_branches'):
+            self.assertEqual(total[key],
+                             sum(func[key] for func in report['functions']))
+
+
+if __name__ == "__main__":
+    unittest.main()
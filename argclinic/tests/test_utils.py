@@ -1,4 +1,5 @@
-from argclinic.utils import hash_text
+from argclinic.utils import Output, StreamOutput, hash_text
+import io
 import unittest
 
 
@@ -8,6 +9,35 @@ class Tests(unittest.TestCase):
         self.assertEqual(hash_text('abc'), 'a9993e364706816a')
         self.assertEqual(hash_text('abc\ndef'), '6a07139fd8d155df')
 
+    def write_lines(self, output):
+        output.write('{')
+        with output.indent():
+            output.write('abc')
+            output.write()
+            output.write('def', 1)
+        output.write('}')
+
+    def test_output(self):
+        output = Output()
+        self.write_lines(output)
+        self.assertEqual(output.output,
+                         ['{', '    abc', '', '        def', '}'])
+
+    def test_stream_output(self):
+        output = Output()
+        self.write_lines(output)
+        text = '\n'.join(output.output)
+
+        file = io.StringIO()
+        stream = StreamOutput(file)
+        self.write_lines(stream)
+        self.assertEqual(file.getvalue(), text + '\n')
+        self.assertEqual(stream.output, [])
+        self.assertEqual(stream.hexdigest(), hash_text(text))
+
+        stream = StreamOutput(io.StringIO())
+        self.assertEqual(stream.hexdigest(), hash_text(''))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,20 +1,26 @@
 import contextlib
 import hashlib
-from typing import Iterator
+from typing import Iterator, TextIO
 
 
 INDENT = ' ' * 4
+HASH_LENGTH = 16
 
 
 class Config:
     def __init__(self):
         self.min_python_ver = (3, 6)
 
+    def to_dict(self) -> dict:
+        return {'min_python_ver': list(self.min_python_ver)}
+
 
 class Output:
     def __init__(self) -> None:
         self.output: list[str] = []
         self._indent = INDENT
+        # indentation prefix per level: _prefixes[level]
+        self._prefixes = ['']
         self.level = 0
 
     @contextlib.contextmanager
@@ -25,13 +31,48 @@ class Output:
         finally:
             self.level -= level
 
+    def _get_prefix(self, level: int) -> str:
+        prefixes = self._prefixes
+        while len(prefixes) <= level:
+            prefixes.append(self._indent * len(prefixes))
+        return prefixes[level]
+
+    def _write_line(self, line: str) -> None:
+        self.output.append(line)
+
     def write(self, line: str = '', level: int = 0) -> None:
         level += self.level
         if level and line:
-            line = self._indent * level + line
-        self.output.append(line)
+            line = self._get_prefix(level) + line
+        self._write_line(line)
+
+
+class StreamOutput(Output):
+    """
+    Output writing lines directly into a file-like object.
+
+    Lines are not kept in memory: the hash of the text is computed
+    incrementally and hexdigest() is equal to hash_text('\n'.join(lines)).
+    """
+    def __init__(self, file: TextIO) -> None:
+        super().__init__()
+        self.file = file
+        self._hash = hashlib.sha1()
+        self._first_line = True
+
+    def _write_line(self, line: str) -> None:
+        if self._first_line:
+            self._first_line = False
+        else:
+            self._hash.update(b'\n')
+        self._hash.update(line.encode("utf-8"))
+        self.file.write(line)
+        self.file.write('\n')
+
+    def hexdigest(self) -> str:
+        return self._hash.hexdigest()[:HASH_LENGTH]
 
 
 def hash_text(text: str) -> str:
     checksum = hashlib.sha1(text.encode("utf-8")).hexdigest()
-    return checksum[:16]
+    return checksum[:HASH_LENGTH]
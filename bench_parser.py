@@ -0,0 +1,51 @@
+"""
+Microbenchmark of the clinic input parsers.
+
+Usage: python bench_parser.py [number of blocks]
+"""
+import sys
+import time
+
+from argclinic.parser import ParseFunction, parse_functions
+
+
+BLOCK = """os.stat{index}
+
+    path : path_t
+    fd: int
+    /
+    *
+    dir_fd : dir_fd = None
+    follow_symlinks: bool = True
+
+Perform a stat system call on the given path.
+
+  path
+    Path to be examined.
+"""
+
+
+def bench(name, func, texts, loops=5):
+    best = None
+    for _ in range(loops):
+        t0 = time.perf_counter()
+        func(texts)
+        dt = time.perf_counter() - t0
+        if best is None or dt < best:
+            best = dt
+    print(f"{name}: {best * 1e3:.1f} ms ({len(texts)} blocks)")
+    return best
+
+
+def main():
+    nblock = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    texts = [BLOCK.format(index=index) for index in range(nblock)]
+
+    old = bench("ParseFunction", lambda texts: [ParseFunction().parse(text)
+                                                for text in texts], texts)
+    new = bench("parse_functions", parse_functions, texts)
+    print(f"speedup: {old / new:.2f}x")
+
+
+if __name__ == "__main__":
+    main()